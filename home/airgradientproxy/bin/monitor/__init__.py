@@ -5,6 +5,8 @@
 
 import syslog
 
+from typing import Any
+
 class Logger(object):
     def __init__(self, service_name: str, log_to_stdout: bool=False, debug_mode: bool=False):
         self.reconfigure(service_name, log_to_stdout, debug_mode)
@@ -36,18 +38,21 @@ class Logger(object):
         else:
             syslog.syslog(level, msg)
 
-    def debug(self, msg: str) -> None:
+    # As with the logging module, msg is %-formatted with args only when
+    # the message is actually logged (debug messages are usually dropped).
+
+    def debug(self, msg: str, *args: Any) -> None:
         if self.debug_mode:
-            self.logmsg(syslog.LOG_DEBUG, msg)
+            self.logmsg(syslog.LOG_DEBUG, msg % args if args else msg)
 
-    def info(self, msg: str) -> None:
-        self.logmsg(syslog.LOG_INFO, msg)
+    def info(self, msg: str, *args: Any) -> None:
+        self.logmsg(syslog.LOG_INFO, msg % args if args else msg)
 
-    def error(self, msg: str) -> None:
-        self.logmsg(syslog.LOG_ERR, msg)
+    def error(self, msg: str, *args: Any) -> None:
+        self.logmsg(syslog.LOG_ERR, msg % args if args else msg)
 
-    def critical(self, msg: str) -> None:
-        self.logmsg(syslog.LOG_CRIT, msg)
+    def critical(self, msg: str, *args: Any) -> None:
+        self.logmsg(syslog.LOG_CRIT, msg % args if args else msg)
 
 # The shared logger.  Logs to stdout until airgradientproxyd reconfigures it
 # from the config file.
@@ -5,25 +5,83 @@
 
 """sqlite storage for readings.  Rows are keyed by record type; CURRENT and
 TWO_MINUTE are single-row record types (delete+insert), ARCHIVE accumulates.
+The latest CURRENT and TWO_MINUTE readings are held in memory and written
+to sqlite along with each archive save, and by flush() (and close()).
 """
 
+import contextlib
+import operator
 import os
 import sqlite3
+import threading
 
 from datetime import datetime
-from dateutil import tz
 from json import dumps
-from typing import Any, Iterator, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from monitor import log
-from monitor.model import Reading, RecordType, convert_to_json
+from monitor.model import FIELD_NAMES, JSON_FIELDS, UTC, Reading, RecordType, convert_to_json, json_time
 
 class DatabaseAlreadyExists(Exception):
     pass
 
 class Database(object):
+    # The columns fetch_rows selects, in Reading's field order: timestamp
+    # (for measurementTime), then the rest of the fields.
+    ROW_FIELDS: Tuple[str, ...] = FIELD_NAMES[1:]
+    # The ROW_FIELDS of a reading, as a tuple, in one call.
+    row_values = operator.attrgetter(*ROW_FIELDS)
+    # Each json key, in JSON_FIELDS order, with its index in a fetched row
+    # (which is its index in FIELD_NAMES: timestamp, then ROW_FIELDS).
+    JSON_COLUMNS: Tuple[Tuple[str, int], ...] = tuple(
+        (field, FIELD_NAMES.index(field)) for field in JSON_FIELDS)
+
+    # The sql text is constant so sqlite3's per-connection statement cache
+    # reuses the prepared statement on every save.  The columns are
+    # record_type, timestamp, then ROW_FIELDS (see insert_values).
+    INSERT_SQL: str = ('INSERT INTO Reading (record_type, timestamp, ' + ', '.join(ROW_FIELDS) + ')'
+        ' VALUES(' + ', '.join(['?'] * (2 + len(ROW_FIELDS))) + ');')
+
+    DELETE_SQL: str = 'DELETE FROM Reading where record_type = ?;'
+
+    SELECT_COLUMNS: str = 'timestamp, ' + ', '.join(ROW_FIELDS)
+
+    # fetch_rows' four selects, by whether max_ts and limit are given.
+    # One row per reading, so a SQL LIMIT counts readings correctly.
+    SELECT_SQL: str = ('SELECT ' + SELECT_COLUMNS +
+        ' FROM Reading WHERE record_type = ? AND timestamp > ? ORDER BY timestamp;')
+    SELECT_MAX_TS_SQL: str = ('SELECT ' + SELECT_COLUMNS +
+        ' FROM Reading WHERE record_type = ? AND timestamp > ? AND timestamp <= ? ORDER BY timestamp;')
+    SELECT_LIMIT_SQL: str = ('SELECT ' + SELECT_COLUMNS +
+        ' FROM Reading WHERE record_type = ? AND timestamp > ? ORDER BY timestamp LIMIT ?;')
+    SELECT_MAX_TS_LIMIT_SQL: str = ('SELECT ' + SELECT_COLUMNS +
+        ' FROM Reading WHERE record_type = ? AND timestamp > ? AND timestamp <= ? ORDER BY timestamp LIMIT ?;')
+
+    EARLIEST_TIMESTAMP_SQL: str = ('SELECT timestamp FROM Reading WHERE record_type = ?'
+        ' ORDER BY timestamp LIMIT 1;')
+
     def __init__(self, db_file: str):
         self.db_file = db_file
+        # One connection for the life of the Database.  Autocommit mode
+        # (isolation_level=None) so transactions are explicit; WAL with
+        # synchronous=NORMAL costs one fsync per commit (at checkpoint time)
+        # rather than two plus a journal rename.
+        self._conn = sqlite3.connect(db_file, timeout=15, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        # 8MB page cache; sort in memory rather than spilling to temp files.
+        self._conn.execute('PRAGMA cache_size=-8000')
+        self._conn.execute('PRAGMA temp_store=MEMORY')
+        # The polling loop and the REST server's request threads share the
+        # connection; a transaction (or a query) holds the lock throughout.
+        # Reentrant, so Database methods can be called inside transaction().
+        self._lock = threading.RLock()
+        # How many transaction() blocks are open (on the thread holding the
+        # lock).
+        self._depth: int = 0
+        # The latest CURRENT and TWO_MINUTE readings, by record type.  sqlite
+        # has them only as of the last archive save or flush().
+        self._pending: Dict[int, Reading] = {}
 
     @staticmethod
     def create(db_file: str) -> 'Database':
@@ -67,14 +125,61 @@ class Database(object):
             ' ledMode                TEXT,'
             ' firmware               TEXT,'
             ' model                  TEXT,'
-            ' PRIMARY KEY (record_type, timestamp));')
+            ' PRIMARY KEY (record_type, timestamp)) WITHOUT ROWID;')
+
+        # Create the table on the Database's own connection (for :memory:,
+        # a second connection would be a different database).
+        database = Database(db_file)
+        database._conn.execute(create_reading_table)
+        return database
+
+    def flush(self) -> None:
+        """Write the in-memory CURRENT and TWO_MINUTE readings to sqlite in a
+        single transaction.  They stay in memory (they are still the latest),
+        so a second flush rewrites the same rows."""
+        if not self._pending:
+            return
+        with self.transaction() as conn:
+            self._write_pending(conn)
+
+    def _write_pending(self, conn: sqlite3.Connection) -> None:
+        # Called in a transaction (which holds the lock).
+        for record_type, r in self._pending.items():
+            conn.execute(Database.DELETE_SQL, (record_type,))
+            conn.execute(Database.INSERT_SQL, Database.insert_values(record_type, r))
 
-        with sqlite3.connect(db_file, timeout=5) as conn:
-            cursor = conn.cursor()
-            cursor.execute(create_reading_table)
-            cursor.close()
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Hold the connection for one transaction: everything executed in
+        the with block, including other Database methods' writes, commits
+        together, or rolls back if the block raises.  A nested transaction()
+        joins the enclosing one as a savepoint: if it raises, only its own
+        writes are rolled back, and only the outermost block commits."""
+        with self._lock:
+            self._depth += 1
+            outermost: bool = self._depth == 1
+            savepoint: str = 'nested_%d' % self._depth
+            try:
+                self._conn.execute('BEGIN IMMEDIATE' if outermost else 'SAVEPOINT ' + savepoint)
+                try:
+                    yield self._conn
+                    self._conn.execute('COMMIT' if outermost else 'RELEASE ' + savepoint)
+                except Exception:
+                    if outermost:
+                        self._conn.execute('ROLLBACK')
+                    else:
+                        self._conn.execute('ROLLBACK TO ' + savepoint)
+                        self._conn.execute('RELEASE ' + savepoint)
+                    raise
+            finally:
+                self._depth -= 1
 
-        return Database(db_file)
+    def close(self) -> None:
+        self.flush()
+        # Closing the last connection checkpoints the WAL and removes the
+        # -wal and -shm files.
+        with self._lock:
+            self._conn.close()
 
     def save_current_reading(self, r: Reading) -> None:
         self.save_reading(RecordType.CURRENT, r)
@@ -85,32 +190,37 @@ class Database(object):
     def save_archive_reading(self, r: Reading) -> None:
         self.save_reading(RecordType.ARCHIVE, r)
 
+    def save_archive_readings(self, readings: List[Reading]) -> None:
+        self.save_readings(RecordType.ARCHIVE, readings)
+
     def save_reading(self, record_type: int, r: Reading) -> None:
-        stamp = r.measurementTime.timestamp()
-        insert_reading_sql: str = ('INSERT INTO Reading ('
-            ' record_type, timestamp, serialno, wifi, pm01, pm02, pm10, pm02Compensated,'
-            ' pm01Standard, pm02Standard, pm10Standard, rco2, pm003Count, pm005Count,'
-            ' pm01Count, pm02Count, pm50Count, pm10Count, atmp, atmpCompensated, rhum,'
-            ' rhumCompensated, tvocIndex, tvocRaw, noxIndex, noxRaw, boot, bootCount,'
-            ' ledMode, firmware, model)'
-            ' VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);')
-        insert_reading_values: Tuple[Any, ...] = (
-            record_type, stamp, r.serialno, r.wifi, r.pm01, r.pm02, r.pm10, r.pm02Compensated,
-            r.pm01Standard, r.pm02Standard, r.pm10Standard, r.rco2, r.pm003Count, r.pm005Count,
-            r.pm01Count, r.pm02Count, r.pm50Count, r.pm10Count, r.atmp, r.atmpCompensated,
-            r.rhum, r.rhumCompensated, r.tvocIndex, r.tvocRaw, r.noxIndex, r.noxRaw, r.boot,
-            r.bootCount, r.ledMode, r.firmware, r.model)
-
-        with sqlite3.connect(self.db_file, timeout=15) as conn:
-            cursor = conn.cursor()
-            # if a current record or two minute record, delete previous current.
-            if record_type == RecordType.CURRENT or record_type == RecordType.TWO_MINUTE:
-                cursor.execute('DELETE FROM Reading where record_type = ?;', (record_type,))
-            # Now insert.
-            cursor.execute(insert_reading_sql, insert_reading_values)
+        self.save_readings(record_type, [r])
+
+    def save_readings(self, record_type: int, readings: List[Reading]) -> None:
+        """Save readings in a single transaction (one commit, however many
+        readings).  CURRENT and TWO_MINUTE are single-row record types, so
+        for them only the last reading is kept, in memory; it is written
+        along with the next ARCHIVE save (in the same transaction, so at no
+        extra commit), or by flush()."""
+        if record_type == RecordType.CURRENT or record_type == RecordType.TWO_MINUTE:
+            if readings:
+                with self._lock:
+                    self._pending[record_type] = readings[-1]
+            return
+        insert_reading_values: List[Tuple[Any, ...]] = [
+            Database.insert_values(record_type, r) for r in readings]
+
+        with self.transaction() as conn:
+            conn.executemany(Database.INSERT_SQL, insert_reading_values)
+            if record_type == RecordType.ARCHIVE:
+                self._write_pending(conn)
+
+    @staticmethod
+    def insert_values(record_type: int, r: Reading) -> Tuple[Any, ...]:
+        return (record_type, r.measurementTime.timestamp()) + Database.row_values(r)
 
     def fetch_current_readings(self) -> Iterator[Reading]:
-        return self.fetch_readings(RecordType.CURRENT, 0)
+        return self.fetch_single_row_readings(RecordType.CURRENT)
 
     def fetch_current_reading_as_json(self) -> str:
         for reading in self.fetch_current_readings():
@@ -119,7 +229,15 @@ class Database(object):
         return '{}'
 
     def fetch_two_minute_readings(self) -> Iterator[Reading]:
-        return self.fetch_readings(RecordType.TWO_MINUTE, 0)
+        return self.fetch_single_row_readings(RecordType.TWO_MINUTE)
+
+    def fetch_single_row_readings(self, record_type: int) -> Iterator[Reading]:
+        # The in-memory reading, if any, is newer than what is in sqlite.
+        with self._lock:
+            reading: Optional[Reading] = self._pending.get(record_type)
+        if reading is not None:
+            return iter([reading])
+        return self.fetch_readings(record_type, 0)
 
     def fetch_two_minute_reading_as_json(self) -> str:
         for reading in self.fetch_two_minute_readings():
@@ -128,83 +246,60 @@ class Database(object):
         return '{}'
 
     def get_earliest_timestamp_as_json(self) -> str:
-        select: str = ('SELECT timestamp FROM Reading WHERE record_type = ?'
-            ' ORDER BY timestamp LIMIT 1')
-        log.debug('get-earliest-timestamp: select: %s' % select)
+        log.debug('get-earliest-timestamp: select: %s', Database.EARLIEST_TIMESTAMP_SQL)
         resp = {}
-        with sqlite3.connect(self.db_file, timeout=5) as conn:
-            cursor = conn.cursor()
-            for row in cursor.execute(select, (RecordType.ARCHIVE,)):
-                log.debug('get-earliest-timestamp: returned %s' % row[0])
-                resp['timestamp'] = row[0]
-                break
-        log.info('get-earliest-timestamp: %s' % dumps(resp))
-        return dumps(resp)
+        with self._lock:
+            row = self._conn.execute(Database.EARLIEST_TIMESTAMP_SQL, (RecordType.ARCHIVE,)).fetchone()
+        if row is not None:
+            log.debug('get-earliest-timestamp: returned %s', row[0])
+            resp['timestamp'] = row[0]
+        contents: str = dumps(resp)
+        log.info('get-earliest-timestamp: %s', contents)
+        return contents
 
     def fetch_archive_readings(self, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> Iterator[Reading]:
         return self.fetch_readings(RecordType.ARCHIVE, since_ts, max_ts, limit)
 
     def fetch_archive_readings_as_json(self, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> str:
-        contents = ''
-        for reading in self.fetch_archive_readings(since_ts, max_ts, limit):
-            if contents != '':
-                contents += ','
-            contents += convert_to_json(reading)
+        # Straight from rows to json-ready dicts; no Reading per row.
+        rows = self.fetch_rows(RecordType.ARCHIVE, since_ts, max_ts, limit)
+        contents = dumps([Database.create_dict_from_row(row) for row in rows], separators=(',', ':'))
         log.info('fetch-archive-records')
-        return '[  %s ]' % contents
+        return contents
 
     def fetch_readings(self, record_type: int, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> Iterator[Reading]:
-        select: str = ('SELECT timestamp, serialno, wifi, pm01, pm02, pm10, pm02Compensated, pm01Standard,'
-            ' pm02Standard, pm10Standard, rco2, pm003Count, pm005Count, pm01Count, pm02Count, pm50Count,'
-            ' pm10Count, atmp, atmpCompensated, rhum, rhumCompensated, tvocIndex, tvocRaw, noxIndex,'
-            ' noxRaw, boot, bootCount, ledMode, firmware, model'
-            ' FROM Reading WHERE record_type = ? AND timestamp > ?')
-        select_values: List[Any] = [record_type, since_ts]
-        if max_ts is not None:
-            select += ' AND timestamp <= ?'
-            select_values.append(max_ts)
-        select += ' ORDER BY timestamp'
-        if limit is not None:
-            # One row per reading, so a SQL LIMIT counts readings correctly.
-            select += ' LIMIT ?'
-            select_values.append(limit)
-        select += ';'
-        log.debug('fetch_readings: select: %s, values: %r' % (select, select_values))
-        with sqlite3.connect(self.db_file, timeout=5) as conn:
-            cursor = conn.cursor()
-            for row in cursor.execute(select, select_values):
-                yield Database.create_reading_from_row(row)
+        for row in self.fetch_rows(record_type, since_ts, max_ts, limit):
+            yield Database.create_reading_from_row(row)
+
+    def fetch_rows(self, record_type: int, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> List[Tuple[Any, ...]]:
+        select: str
+        select_values: Tuple[Any, ...]
+        if max_ts is None:
+            if limit is None:
+                select, select_values = Database.SELECT_SQL, (record_type, since_ts)
+            else:
+                select, select_values = Database.SELECT_LIMIT_SQL, (record_type, since_ts, limit)
+        else:
+            if limit is None:
+                select, select_values = Database.SELECT_MAX_TS_SQL, (record_type, since_ts, max_ts)
+            else:
+                select, select_values = Database.SELECT_MAX_TS_LIMIT_SQL, (record_type, since_ts, max_ts, limit)
+        log.debug('fetch_readings: select: %s, values: %r', select, select_values)
+        # Fetch all rows while holding the lock; a generator paused mid-query
+        # would hold the shared connection (and its lock) for its caller.
+        with self._lock:
+            return self._conn.execute(select, select_values).fetchall()
+
+    @staticmethod
+    def create_dict_from_row(row: Tuple[Any, ...]) -> Dict[str, Any]:
+        """Same dict as convert_to_dict(create_reading_from_row(row))."""
+        reading_dict: Dict[str, Any] = {
+            field: value for field, i in Database.JSON_COLUMNS if (value := row[i]) is not None}
+        reading_dict['measurementTime'] = json_time(datetime.fromtimestamp(row[0], tz=UTC))
+        return reading_dict
 
     @staticmethod
-    def create_reading_from_row(row) -> Reading:
-        return Reading(
-            measurementTime        = datetime.fromtimestamp(row[0], tz=tz.gettz('UTC')),
-            serialno               = row[1],
-            wifi                   = row[2],
-            pm01                   = row[3],
-            pm02                   = row[4],
-            pm10                   = row[5],
-            pm02Compensated        = row[6],
-            pm01Standard           = row[7],
-            pm02Standard           = row[8],
-            pm10Standard           = row[9],
-            rco2                   = row[10],
-            pm003Count             = row[11],
-            pm005Count             = row[12],
-            pm01Count              = row[13],
-            pm02Count              = row[14],
-            pm50Count              = row[15],
-            pm10Count              = row[16],
-            atmp                   = row[17],
-            atmpCompensated        = row[18],
-            rhum                   = row[19],
-            rhumCompensated        = row[20],
-            tvocIndex              = row[21],
-            tvocRaw                = row[22],
-            noxIndex               = row[23],
-            noxRaw                 = row[24],
-            boot                   = row[25],
-            bootCount              = row[26],
-            ledMode                = row[27],
-            firmware               = row[28],
-            model                  = row[29])
+    def create_reading_from_row(row: Tuple[Any, ...]) -> Reading:
+        # Positional: row is timestamp followed by ROW_FIELDS, which is
+        # Reading's field order.
+        return Reading(datetime.fromtimestamp(row[0], tz=UTC), *row[1:])
@@ -7,10 +7,15 @@
 proxy serves (which mirrors the json the AirGradient device serves).
 """
 
-from dataclasses import dataclass
-from datetime import datetime
+import operator
+
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
 from json import dumps
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+
+# All times are tz-aware UTC.
+UTC = timezone.utc
 
 # Sample AirGradient One reading
 #{"pm01":0.67,
@@ -72,7 +77,8 @@ from typing import Any, Dict, Optional
 # "model":"O-1PST"}
 
 # https://github.com/airgradienthq/arduino/blob/master/docs/local-server.md
-@dataclass
+# slots: no per-instance __dict__, and attribute access is a slot lookup.
+@dataclass(slots=True)
 class Reading:
     measurementTime : datetime        # time of reading
     serialno        : str             # Serial Number of the monitor
@@ -105,12 +111,57 @@ class Reading:
     firmware        : Optional[str  ] # Current firmware version
     model           : Optional[str  ] # Current model name
 
+    def __copy__(self) -> 'Reading':
+        # Every field is immutable, so a shallow copy is a full copy.  One
+        # positional construction beats copy.copy's __reduce_ex__ round trip.
+        return Reading(*field_values(self))
+
+# Reading's field names, in declaration order, and all the fields of a
+# reading, in that order, in one call.
+FIELD_NAMES: Tuple[str, ...] = tuple(field.name for field in fields(Reading))
+field_values = operator.attrgetter(*FIELD_NAMES)
+
+# The numeric fields that are averaged over a poll window.  The remaining
+# fields (measurementTime, serialno, boot, bootCount, ledMode, firmware,
+# model) describe the sensor and are taken from the latest reading.
+AVERAGED_FIELDS: Tuple[str, ...] = (
+    'wifi', 'pm01', 'pm02', 'pm10', 'pm02Compensated', 'pm01Standard',
+    'pm02Standard', 'pm10Standard', 'rco2', 'pm003Count', 'pm005Count',
+    'pm01Count', 'pm02Count', 'pm50Count', 'pm10Count', 'atmp',
+    'atmpCompensated', 'rhum', 'rhumCompensated', 'tvocIndex', 'tvocRaw',
+    'noxIndex', 'noxRaw')
+
+# AVERAGED_FIELDS are a contiguous run of Reading's fields; this is their
+# slice of field_values(reading).
+AVERAGED_SLICE = slice(FIELD_NAMES.index(AVERAGED_FIELDS[0]), FIELD_NAMES.index(AVERAGED_FIELDS[-1]) + 1)
+assert FIELD_NAMES[AVERAGED_SLICE] == AVERAGED_FIELDS
+
 class RecordType:
     CURRENT   : int = 0
     ARCHIVE   : int = 1
     TWO_MINUTE: int = 2
 
+# The json keys of a reading (other than measurementTime, which comes last),
+# in the order the device serves them.  convert_to_dict and
+# Database.create_dict_from_row both emit keys in this order.
+JSON_FIELDS: Tuple[str, ...] = (
+    'pm01', 'pm02', 'pm10', 'pm01Standard', 'pm02Standard', 'pm10Standard',
+    'pm003Count', 'pm005Count', 'pm01Count', 'pm02Count', 'pm50Count',
+    'pm10Count', 'pm02Compensated', 'atmp', 'atmpCompensated', 'rhum',
+    'rhumCompensated', 'rco2', 'tvocIndex', 'tvocRaw', 'noxIndex', 'noxRaw',
+    'boot', 'bootCount', 'wifi', 'ledMode', 'serialno', 'firmware', 'model')
+assert sorted(JSON_FIELDS) == sorted(FIELD_NAMES[1:])
+
 def convert_to_json(reading: Reading) -> str:
+    return dumps(convert_to_dict(reading), separators=(',', ':'))
+
+def json_time(dt: datetime) -> str:
+    # Same text as strftime('%Y-%m-%dT%H:%M:%S.%fZ'), without parsing a format.
+    return dt.replace(tzinfo=None).isoformat(timespec='microseconds') + 'Z'
+
+def convert_to_dict(reading: Reading) -> Dict[str, Any]:
+    """The json-ready dict for a reading: the device's fields (those it
+    reports), in JSON_FIELDS order, plus measurementTime."""
     reading_dict: Dict[str, Any] = {}
     if reading.pm01 is not None:
         reading_dict['pm01'           ] = reading.pm01
@@ -171,6 +222,6 @@ def convert_to_json(reading: Reading) -> str:
     if reading.model is not None:
         reading_dict['model'          ] = reading.model
 
-    reading_dict['measurementTime' ] = reading.measurementTime.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    reading_dict['measurementTime' ] = json_time(reading.measurementTime)
 
-    return dumps(reading_dict)
+    return reading_dict
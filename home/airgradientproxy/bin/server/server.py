@@ -36,23 +36,23 @@ class Request:
 class Handler(http.server.BaseHTTPRequestHandler):
     """Handle requests in a separate thread."""
     def do_GET(self):
-        assert(db_file)
+        assert(database)
         request =  Handler.parse_requestline(self.requestline)
         if request.request_type == RequestType.GET_VERSION:
             self.respond_success(dumps({'version': VERSION}))
-            log.info('get-version: %s' % VERSION)
+            log.info('get-version: %s', VERSION)
         elif request.request_type == RequestType.GET_EARLIEST_TIMESTAMP:
-            self.respond_success(Database(db_file).get_earliest_timestamp_as_json())
+            self.respond_success(database.get_earliest_timestamp_as_json())
         elif request.request_type == RequestType.FETCH_CURRENT_RECORD:
-            self.respond_success(Database(db_file).fetch_current_reading_as_json())
+            self.respond_success(database.fetch_current_reading_as_json())
         elif request.request_type == RequestType.FETCH_TWO_MINUTE_RECORD:
-            self.respond_success(Database(db_file).fetch_two_minute_reading_as_json())
+            self.respond_success(database.fetch_two_minute_reading_as_json())
         elif request.request_type == RequestType.FETCH_ARCHIVE_RECORDS:
             # since_ts of zero (fetch everything) is legal.
             assert request.since_ts is not None
-            self.respond_success(Database(db_file).fetch_archive_readings_as_json(request.since_ts, request.max_ts, request.limit))
+            self.respond_success(database.fetch_archive_readings_as_json(request.since_ts, request.max_ts, request.limit))
         else:
-            log.info('request_error: %s' % request.error)
+            log.info('request_error: %s', request.error)
             self.respond_error(request.error)
 
     def respond_success(self, json: str) -> None:
@@ -141,7 +141,8 @@ class Handler(http.server.BaseHTTPRequestHandler):
             error        = error,
             request      = request)
 
-db_file: Optional[str] = None
+# Shared by all request threads (Database serializes use of its connection).
+database: Optional[Database] = None
 
 def start_server(port: int):
     class ThreadingHTTPServer6(http.server.ThreadingHTTPServer):
@@ -149,9 +150,9 @@ def start_server(port: int):
     with ThreadingHTTPServer6(('::', port), Handler) as server:
         server.serve_forever()
 
-def serve_requests(port: int, db_file_in: str):
-    global db_file
-    db_file = db_file_in
+def serve_requests(port: int, database_in: Database):
+    global database
+    database = database_in
     daemon = threading.Thread(name='airgradientproxy_daemon_server',
                               target=start_server,
                               args=[port])
@@ -181,6 +182,6 @@ if __name__ == '__main__':
         assert(options.port)
         assert(options.db_file)
         log.reconfigure('server.py', log_to_stdout=True)
-        serve_requests(options.port, options.db_file)
+        serve_requests(options.port, Database(options.db_file))
         print('Hit return to exit...', end='')
         _ = input()
@@ -20,10 +20,9 @@ import os
 import sys
 import tempfile
 
-import requests
+import http.client
 
 from datetime import datetime, timedelta
-from dateutil import tz
 from dateutil.parser import parse
 from json import loads
 from time import sleep
@@ -33,16 +32,17 @@ import fixtures
 
 from fixtures import InsaneReading, create_test_reading, print_failed, print_passed
 from monitor.database import Database
-from monitor.model import Reading, convert_to_json
-from monitor.service import Service
+from monitor.model import UTC, Reading, convert_to_json
+from monitor.service import RunningAverage, Service
 
 def collect_two_readings_one_second_apart(hostname: str, port: int, timeout_secs: int, long_read_secs: int) -> Tuple[Reading, Reading]:
     try:
-        session: requests.Session = requests.Session()
+        conn: http.client.HTTPConnection = http.client.HTTPConnection(hostname, port, timeout=timeout_secs)
         print('collect_two_readings_one_seconds_apart...', end='')
-        reading1: Reading = Service.collect_data(session, hostname, port, timeout_secs, long_read_secs)
+        reading1: Reading = Service.collect_data(conn, long_read_secs)
         sleep(1) # to get a different time (to the second) on reading2
-        reading2: Reading = Service.collect_data(session, hostname, port, timeout_secs, long_read_secs)
+        reading2: Reading = Service.collect_data(conn, long_read_secs)
+        conn.close()
         print_passed()
         return reading1, reading2
     except Exception as e:
@@ -54,7 +54,7 @@ def run_tests(service_name: str, hostname: str, port: int, timeout_secs: int, lo
     test_db_archive_records(service_name, reading)
     test_db_current_records(service_name, reading, reading2)
     sanity_check_reading(reading)
-    test_compute_avg(reading)
+    test_running_average(reading)
     test_convert_to_json(reading, reading2)
 
 def sanity_check_reading(reading: Reading) -> None:
@@ -65,116 +65,56 @@ def sanity_check_reading(reading: Reading) -> None:
     else:
         print_failed(InsaneReading(reason))
 
-def test_compute_avg(reading: Reading) -> None:
+def test_running_average(reading: Reading) -> None:
     try:
-        print('test_compute_avg....', end='')
+        print('test_running_average....', end='')
         reading1: Reading = copy.copy(reading)
         reading2: Reading = copy.copy(reading)
 
-        reading1.measurementTime = datetime.now(tz=tz.gettz('UTC')) - timedelta(seconds=15)
-        reading2.measurementTime = datetime.now(tz=tz.gettz('UTC'))
-
-        reading1.wifi            = -71.0
-        reading2.wifi            = -72.0
-
-        reading1.pm01            = 325.0
-        reading2.pm01            = 347.0
-
-        reading1.pm02            = 221.0
-        reading2.pm02            = 230.0
-
-        reading1.pm10            = 410.0
-        reading2.pm10            = 415.0
-
-        reading1.pm02Compensated = 201.0
-        reading2.pm02Compensated = 212.0
-
-        reading1.pm01Standard   = 340.0
-        reading2.pm01Standard   = 346.0
-
-        reading1.pm02Standard   = 246.0
-        reading2.pm02Standard   = 248.0
-
-        reading1.pm10Standard    = 612.0
-        reading2.pm10Standard    = 614.0
-
-        reading1.rco2            = 746.0
-        reading2.rco2            = 750.0
-
-        reading1.pm003Count      = 112.0
-        reading2.pm003Count      = 185.0
-
-        reading1.pm005Count      = 356.0
-        reading2.pm005Count      = 385.0
-
-        reading1.pm01Count       = 643.0
-        reading2.pm01Count       = 647.0
-
-        reading1.pm02Count       = 331.0
-        reading2.pm02Count       = 338.0
-
-        reading1.pm50Count       = 123.0
-        reading2.pm50Count       = 456.0
-
-        reading1.pm10Count       = 432.0
-        reading2.pm10Count       = 234.0
-
-        reading1.atmp            = 20.5
-        reading2.atmp            = 20.9
-
-        reading1.atmpCompensated = 19.5
-        reading2.atmpCompensated = 19.9
-
-        reading1.rhum            = 64.2
-        reading2.rhum            = 64.6
-
-        reading1.rhumCompensated = 60.2
-        reading2.rhumCompensated = 60.6
-
-        reading1.tvocIndex      = 7.0
-        reading2.tvocIndex      = 9.0
-
-        reading1.tvocRaw         = 4.0
-        reading2.tvocRaw         = 5.0
-
-        reading1.noxIndex        = 12.0
-        reading2.noxIndex        = 14.0
-
-        reading1.noxRaw          = 10.0
-        reading2.noxRaw          = 11.0
-
-        readings: List[Reading] = []
-        readings.append(reading1)
-        readings.append(reading2)
-
-        avg_reading: Reading = Service.compute_avg(readings)
+        reading1.measurementTime = datetime.now(tz=UTC) - timedelta(seconds=15)
+        reading2.measurementTime = datetime.now(tz=UTC)
+
+        # (field, reading1 value, reading2 value, expected average)
+        averaged: List[Tuple[str, float, float, float]] = [
+            ('wifi',            -71.0, -72.0, -71.5),
+            ('pm01',            325.0, 347.0, 336.0),
+            ('pm02',            221.0, 230.0, 225.5),
+            ('pm10',            410.0, 415.0, 412.5),
+            ('pm02Compensated', 201.0, 212.0, 206.5),
+            ('pm01Standard',    340.0, 346.0, 343.0),
+            ('pm02Standard',    246.0, 248.0, 247.0),
+            ('pm10Standard',    612.0, 614.0, 613.0),
+            ('rco2',            746.0, 750.0, 748.0),
+            ('pm003Count',      112.0, 185.0, 148.5),
+            ('pm005Count',      356.0, 385.0, 370.5),
+            ('pm01Count',       643.0, 647.0, 645.0),
+            ('pm02Count',       331.0, 338.0, 334.5),
+            ('pm50Count',       123.0, 456.0, 289.5),
+            ('pm10Count',       432.0, 234.0, 333.0),
+            ('atmp',             20.5,  20.9,  20.7),
+            ('atmpCompensated',  19.5,  19.9,  19.7),
+            ('rhum',             64.2,  64.6,  64.4),
+            ('rhumCompensated',  60.2,  60.6,  60.4),
+            ('tvocIndex',         7.0,   9.0,   8.0),
+            ('tvocRaw',           4.0,   5.0,   4.5),
+            ('noxIndex',         12.0,  14.0,  13.0),
+            ('noxRaw',           10.0,  11.0,  10.5)]
+        for field, value1, value2, _ in averaged:
+            setattr(reading1, field, value1)
+            setattr(reading2, field, value2)
+
+        running = RunningAverage()
+        running.add(reading1)
+        running.add(reading2)
+
+        avg_reading: Reading = running.average()
 
         assert avg_reading.measurementTime == reading2.measurementTime, 'Expected measurementTime: %r, got %r.' % (reading2.measurementTime, avg_reading.measurementTime)
 
         assert avg_reading.serialno == reading2.serialno
-        assert avg_reading.wifi is not None and math.isclose(avg_reading.wifi, -71.5)
-        assert avg_reading.pm01 == 336
-        assert avg_reading.pm02 is not None and math.isclose(avg_reading.pm02, 225.5)
-        assert avg_reading.pm10 is not None and math.isclose(avg_reading.pm10, 412.5)
-        assert avg_reading.pm02Compensated is not None and math.isclose(avg_reading.pm02Compensated, 206.5)
-        assert avg_reading.pm01Standard == 343
-        assert avg_reading.pm02Standard == 247
-        assert avg_reading.pm10Standard == 613
-        assert avg_reading.rco2 == 748
-        assert avg_reading.pm003Count is not None and math.isclose(avg_reading.pm003Count, 148.5)
-        assert avg_reading.pm005Count is not None and math.isclose(avg_reading.pm005Count, 370.5)
-        assert avg_reading.pm01Count == 645
-        assert avg_reading.pm02Count is not None and math.isclose(avg_reading.pm02Count, 334.5)
-        assert avg_reading.pm50Count is not None and math.isclose(avg_reading.pm50Count, 289.5)
-        assert avg_reading.pm10Count == 333
-        assert avg_reading.atmp is not None and math.isclose(avg_reading.atmp, 20.7)
-        assert avg_reading.atmpCompensated is not None and math.isclose(avg_reading.atmpCompensated, 19.7)
-        assert avg_reading.rhum is not None and math.isclose(avg_reading.rhum, 64.4)
-        assert avg_reading.rhumCompensated is not None and math.isclose(avg_reading.rhumCompensated, 60.4)
-        assert avg_reading.tvocIndex == 8
-        assert avg_reading.tvocRaw is not None and math.isclose(avg_reading.tvocRaw, 4.5)
-        assert avg_reading.noxIndex == 13
-        assert avg_reading.noxRaw is not None and math.isclose(avg_reading.noxRaw, 10.5)
+        for field, _, _, expected in averaged:
+            got = getattr(avg_reading, field)
+            assert got is not None and math.isclose(got, expected), 'Expected %s: %r, got %r.' % (field, expected, got)
         assert avg_reading.boot == reading2.boot
         assert avg_reading.bootCount == reading2.bootCount
         assert avg_reading.ledMode == reading2.ledMode
@@ -201,6 +141,7 @@ def test_db_archive_records(service_name: str, reading_in: Reading) -> None:
             cnt += 1
         if cnt != 1:
             print('test_db_archive_records failed with count: %d' % cnt)
+        db.close()
         print_passed()
     except Exception as e:
         print('test_db_archive_records failed: %s' % e)
@@ -225,6 +166,7 @@ def test_db_current_records(service_name: str, reading_in_1: Reading, reading_in
             cnt += 1
         if cnt != 1:
             print('test_db_current_records failed with count: %d' % cnt)
+        db.close()
         print_passed()
     except Exception as e:
         print('test_db_current_records failed: %s' % e)
@@ -239,7 +181,7 @@ def test_convert_to_json(reading1: Reading, reading2: Reading) -> None:
         convert_to_json(reading1)
         convert_to_json(reading2)
 
-        tzinfos = {'CST': tz.gettz("UTC")}
+        tzinfos = {'CST': UTC}
         reading = create_test_reading(parse('2019/12/15T03:43:05UTC', tzinfos=tzinfos))
         json_reading: str = convert_to_json(reading)
 
@@ -13,19 +13,23 @@ tests/test-live.py).
 Exits non-zero if any test fails.
 """
 
+import copy
+import math
 import os
+import sqlite3
 import sys
 import tempfile
 
 from datetime import datetime, timedelta
-from dateutil import tz
+from json import loads
 
 sys.path.insert(0, os.path.join(
     os.path.dirname(os.path.abspath(__file__)), '..', 'home', 'airgradientproxy', 'bin'))
 
 from fixtures import create_test_reading, create_open_air_test_reading
 from monitor.database import Database
-from monitor.service import Service
+from monitor.model import UTC, RecordType, convert_to_json
+from monitor.service import RunningAverage, Service, SlidingAverage
 import server.server as srv
 
 failures = []
@@ -37,7 +41,7 @@ def check(label: str, cond: bool, detail: str = '') -> None:
         failures.append(label)
         print('FAIL: %s %s' % (label, detail))
 
-now = datetime.now(tz=tz.gettz('UTC')).replace(microsecond=0)
+now = datetime.now(tz=UTC).replace(microsecond=0)
 
 # --- build a database holding 5 archive readings 60s apart ---
 tmp = tempfile.NamedTemporaryFile(prefix='airgradient-proxy-test', suffix='.sdb', delete=False)
@@ -82,6 +86,13 @@ check('since_ts exclusive', len(out) == 4, 'got %d' % len(out))
 js = db.get_earliest_timestamp_as_json()
 check('earliest timestamp', ('"timestamp": %d' % first_ts) in js, js)
 
+# archive json is one array holding one object per reading.
+js = db.fetch_archive_readings_as_json(0, limit=2)
+check('archive json', loads(js) == [loads(convert_to_json(r)) for r in readings_in[:2]], js)
+check('archive json keys in the same order as convert_to_json',
+      js == '[' + ','.join(convert_to_json(r) for r in readings_in[:2]) + ']', js)
+check('empty archive json', loads(db.fetch_archive_readings_as_json(2 ** 32)) == [])
+
 # 6. save path edge case: an Open Air reading (no pm50Count/pm10Count/ledMode)
 #    must round trip with its None fields preserved.
 open_air = create_open_air_test_reading(now + timedelta(seconds=600))
@@ -92,8 +103,13 @@ check('open air reading round trips', len(out) == 1 and out[0] == open_air,
 check('open air None fields preserved',
       len(out) == 1 and out[0].pm50Count is None and out[0].pm10Count is None
       and out[0].ledMode is None)
+js = db.fetch_archive_readings_as_json(int((now + timedelta(seconds=500)).timestamp()))
+check('open air archive json omits None fields', loads(js) == [loads(convert_to_json(open_air))], js)
+check('open air archive json keys in the same order as convert_to_json',
+      js == '[' + convert_to_json(open_air) + ']', js)
 
-# 7. CURRENT and TWO_MINUTE stay single-row via delete+insert.
+# 7. CURRENT and TWO_MINUTE stay single-row (in memory, then delete+insert
+#    on an archive save or flush).
 db.save_current_reading(readings_in[0])
 db.save_current_reading(readings_in[1])
 cur = list(db.fetch_current_readings())
@@ -104,12 +120,74 @@ db.save_two_minute_reading(readings_in[2])
 two = list(db.fetch_two_minute_readings())
 check('two minute reading single row, latest wins',
       len(two) == 1 and two[0].measurementTime == readings_in[2].measurementTime)
+con = sqlite3.connect(tmp.name)
+check('current and two minute readings not written before flush',
+      con.execute('SELECT COUNT(*) FROM Reading WHERE record_type != ?', (RecordType.ARCHIVE,)).fetchone()[0] == 0)
+db.flush()
+check('flush writes one current and one two minute row',
+      con.execute('SELECT record_type, timestamp FROM Reading WHERE record_type != ? ORDER BY record_type',
+                  (RecordType.ARCHIVE,)).fetchall()
+      == [(RecordType.CURRENT, readings_in[1].measurementTime.timestamp()),
+          (RecordType.TWO_MINUTE, readings_in[2].measurementTime.timestamp())])
+con.close()
+db.save_current_reading(readings_in[2])
+db.save_archive_reading(create_test_reading(now + timedelta(seconds=800)))
+reopened = Database(tmp.name)
+cur = list(reopened.fetch_current_readings())
+reopened.close()
+check('archive save also writes the pending current reading',
+      len(cur) == 1 and cur[0].measurementTime == readings_in[2].measurementTime)
+
+# 8. save_archive_readings saves a batch in one transaction; a batch with
+#    a duplicate timestamp saves nothing.
+batch = [create_test_reading(now + timedelta(seconds=1000 + 60 * i)) for i in range(3)]
+db.save_archive_readings(batch)
+out = list(db.fetch_archive_readings(int((now + timedelta(seconds=900)).timestamp())))
+check('batch of 3 archive readings saved', out == batch, 'got %d' % len(out))
+dup_batch = [create_test_reading(now + timedelta(seconds=2000)), batch[0]]
+raised = False
+try:
+    db.save_archive_readings(dup_batch)
+except sqlite3.IntegrityError:
+    raised = True
+check('duplicate in batch raises', raised)
+out = list(db.fetch_archive_readings(int((now + timedelta(seconds=1900)).timestamp())))
+check('failed batch is rolled back', len(out) == 0, 'got %d' % len(out))
+
+# transaction(): Database's own save methods can be called inside it; their
+# writes commit (or roll back) with the enclosing block.
+mem = Database.create(':memory:')
+t_readings = [create_test_reading(now + timedelta(seconds=60 * i)) for i in range(4)]
+with mem.transaction():
+    mem.save_current_reading(t_readings[0])
+    mem.save_archive_reading(t_readings[0])
+mem_rows = mem._conn.execute('SELECT record_type FROM Reading ORDER BY record_type').fetchall()
+check('save inside transaction() commits with it',
+      mem_rows == [(RecordType.CURRENT,), (RecordType.ARCHIVE,)], 'got %r' % mem_rows)
+try:
+    with mem.transaction():
+        mem.save_archive_reading(t_readings[1])
+        raise ValueError('abandon')
+except ValueError:
+    pass
+check('save inside a failed transaction() is rolled back',
+      [r.measurementTime for r in mem.fetch_archive_readings()] == [t_readings[0].measurementTime])
+with mem.transaction():
+    mem.save_archive_reading(t_readings[2])
+    try:
+        mem.save_archive_readings([t_readings[3], t_readings[3]])
+    except sqlite3.IntegrityError:
+        pass
+check('a failed nested save rolls back only its own writes',
+      [r.measurementTime for r in mem.fetch_archive_readings()]
+      == [t_readings[0].measurementTime, t_readings[2].measurementTime])
+mem.close()
 
-# 8. is_sane.
-sane_r = create_test_reading(datetime.now(tz=tz.gettz('UTC')))
+# 9. is_sane.
+sane_r = create_test_reading(datetime.now(tz=UTC))
 ok, _ = Service.is_sane(sane_r)
 check('sane reading passes', ok)
-open_air_r = create_open_air_test_reading(datetime.now(tz=tz.gettz('UTC')))
+open_air_r = create_open_air_test_reading(datetime.now(tz=UTC))
 ok, _ = Service.is_sane(open_air_r)
 check('open air reading (None fields) passes', ok)
 sane_r.boot = True
@@ -124,12 +202,100 @@ sane_r.atmp = 21
 ok, reason = Service.is_sane(sane_r)
 check('int atmp rejected', not ok and reason == 'atmp not instance of float', reason)
 sane_r.atmp = 21.66
-stale = create_test_reading(datetime.now(tz=tz.gettz('UTC')) - timedelta(seconds=60))
+sane_r.pm01 = 0
+sane_r.pm50Count = 0
+ok, reason = Service.is_sane(sane_r)
+check('int pm01 and pm50Count accepted', ok, reason)
+sane_r.pm01 = True
+ok, reason = Service.is_sane(sane_r)
+check('bool pm01 rejected', not ok and reason == 'pm01 not instance of int or float', reason)
+sane_r.pm01 = 0.67
+sane_r.pm50Count = 0.0
+sane_r.serialno = 1234
+ok, reason = Service.is_sane(sane_r)
+check('int serialno rejected', not ok and reason == 'serialno not instance of str', reason)
+sane_r.serialno = '000000000000'
+stale = create_test_reading(datetime.now(tz=UTC) - timedelta(seconds=60))
 ok, reason = Service.is_sane(stale)
 check('stale measurementTime rejected',
       not ok and reason.startswith('measurementTime more than 20s off'), reason)
 
-# 9. REST request parsing.
+# parse_response: numbers become floats, absent and null fields None.
+parsed = Service.parse_response(
+    b'{"pm01":0,"pm02":0.5,"rco2":599.33,"boot":3,"wifi":-73,"noxIndex":null,'
+    b'"serialno":"000000000000","firmware":"3.3.9","model":"O-1PST"}')
+check('parse_response converts numbers to float',
+      type(parsed.pm01) is float and parsed.pm02 == 0.5 and parsed.wifi == -73.0)
+check('parse_response absent and null fields are None',
+      parsed.pm50Count is None and parsed.noxIndex is None and parsed.ledMode is None)
+check('parse_response passes ints and strs through',
+      parsed.boot == 3 and parsed.model == 'O-1PST')
+ok, reason = Service.is_sane(parsed)
+check('parsed reading is sane', ok, reason)
+ok, reason = Service.is_sane(parsed, parsed=True)
+check('parsed reading is sane with parsed=True', ok, reason)
+parsed.boot = True
+ok, reason = Service.is_sane(parsed, parsed=True)
+check('parsed=True still rejects bool boot', not ok and reason == 'boot not instance of int', reason)
+
+# 10. RunningAverage: fields are averaged, a field missing from any reading
+#     averages to None, and the rest comes from the latest reading.
+avg_a = create_test_reading(now)
+avg_b = create_open_air_test_reading(now + timedelta(seconds=30))
+avg_b.pm01 = 1.67
+running = RunningAverage()
+running.add(avg_a)
+running.add(avg_b)
+avg = running.average()
+check('RunningAverage averages',
+      running.count == 2 and math.isclose(avg.pm01, 1.17) and avg.rco2 == 547.0, 'got %r' % avg)
+check('RunningAverage None when any reading lacks a field', avg.pm50Count is None)
+check('RunningAverage takes the rest from the latest reading',
+      avg.measurementTime == avg_b.measurementTime and avg.model == 'O-1PST')
+running.clear()
+running.add(avg_a)
+check('RunningAverage starts over after clear', running.count == 1 and running.average() == avg_a)
+
+copied = copy.copy(avg_b)
+check('copy.copy of a Reading is an equal, separate Reading', copied == avg_b and copied is not avg_b)
+
+# SlidingAverage.trim drops (and un-averages) readings over 2 minutes old.
+utc_now = datetime.now(tz=UTC)
+window = [create_test_reading(utc_now - timedelta(seconds=180)),
+          create_test_reading(utc_now - timedelta(seconds=150)),
+          create_test_reading(utc_now - timedelta(seconds=60)),
+          create_open_air_test_reading(utc_now)]
+window[0].pm01 = 100.0
+window[3].pm01 = 1.67
+sliding = SlidingAverage()
+for r in window:
+    sliding.add(r)
+sliding.trim(utc_now.timestamp() - 120.0)
+check('trim drops readings older than two minutes', sliding.count == 2,
+      'got %d' % sliding.count)
+unexpired = RunningAverage()
+for r in window[2:]:
+    unexpired.add(r)
+check('trimmed SlidingAverage matches an average of the unexpired readings',
+      sliding.average() == unexpired.average()
+      and sliding.average().pm50Count is None
+      and sliding.average().measurementTime == window[3].measurementTime,
+      'got %r' % sliding.average())
+sliding.trim(utc_now.timestamp() + 1.0)
+check('trimming everything empties the window', sliding.count == 0)
+
+# Once nonzero readings have all expired and only zeros remain, the average
+# is exactly zero (no rounding error left behind by the expired readings).
+sliding = SlidingAverage()
+for i in range(60):
+    polled = create_test_reading(utc_now + timedelta(seconds=5 * i))
+    polled.pm02 = (i * 37.3) % 400 / 3 if i < 30 else 0.0
+    sliding.add(polled)
+    sliding.trim(polled.measurementTime.timestamp() - 120.0)
+check('expired readings leave no rounding error', sliding.average().pm02 == 0.0,
+      'got %r' % sliding.average().pm02)
+
+# 11. REST request parsing.
 req = srv.Handler.parse_requestline('GET /fetch-archive-records?since_ts=0 HTTP/1.1')
 check('since_ts=0 parses as FETCH_ARCHIVE_RECORDS',
       req.request_type == srv.RequestType.FETCH_ARCHIVE_RECORDS and req.since_ts == 0)
@@ -154,6 +320,7 @@ check('bare / is an error', req.request_type == srv.RequestType.ERROR)
 req = srv.Handler.parse_requestline('GET /nonsense HTTP/1.1')
 check('unknown command is an error', req.request_type == srv.RequestType.ERROR)
 
+db.close()
 os.unlink(tmp.name)
 print()
 if failures: